@@ -5,7 +5,8 @@ from __future__ import annotations
 import asyncio
 import logging
 import struct
-from typing import Any, List
+import time
+from typing import Callable, Dict, List, Tuple
 
 from bleak.backends.device import BLEDevice
 from bleak.exc import BleakError
@@ -25,9 +26,33 @@ from .constants import (
 
 _LOGGER = logging.getLogger(__name__)
 
+_SETTINGS_STRUCT = struct.Struct(">?HH")
+_USHORT_STRUCT = struct.Struct(">H")
+_UINT_STRUCT = struct.Struct(">I")
+
+# Full characteristic layouts for all 4 valves, decoded in a single call
+_ALL_SETTINGS = struct.Struct(">?HH?HH?HH?HH")
+_ALL_STATES = struct.Struct(">bIbIbIbI")
+
+# The time shift only moves when the local UTC offset does, so recompute it
+# at most once a minute rather than on every decode
+_TIME_SHIFT_TTL = 60
+_time_shift_cache: Tuple[float, int] | None = None
+
+_ZONE_KEYS = frozenset(("zone1", "zone2", "zone3", "zone4"))
+
 GLOBAL_BLUETOOTH_LOCK: asyncio.Lock = None  # type: ignore
 
 
+def _cached_time_shift() -> int:
+    """Returns time_shift(), memoized for up to _TIME_SHIFT_TTL seconds"""
+    global _time_shift_cache  # pylint: disable=global-statement
+    now = time.monotonic()
+    if _time_shift_cache is None or now - _time_shift_cache[0] > _TIME_SHIFT_TTL:
+        _time_shift_cache = (now, time_shift())
+    return _time_shift_cache[1]
+
+
 def global_bluetooth_lock():
     """Initialize the global bluetooth lock inside the current event loop."""
     global GLOBAL_BLUETOOTH_LOCK  # pylint: disable=global-statement
@@ -39,24 +64,27 @@ def global_bluetooth_lock():
 class Valve:
     """Wrapper class to handle interacting with individual valves on a Melnor timer"""
 
-    _device: Any
-    _id: int
-    _is_watering: bool
-    _manual_minutes: int
+    __slots__ = (
+        "_device",
+        "_id",
+        "_is_watering",
+        "_manual_minutes",
+        "_end_time",
+        "_offset",
+    )
 
     def __init__(self, identifier: int, device) -> None:
-        global_bluetooth_lock()
-
         self._device = device
         self._id = identifier
         self._is_watering = False
         self._manual_minutes = 20
         self._end_time = 0
+        self._offset = identifier * 5
 
     def update_state(self, raw_bytes: bytes, uuid: str) -> None:
         """Update the state of the valve from the raw bytes"""
 
-        offset = self._id * 5
+        offset = self._offset
 
         if uuid == VALVE_MANUAL_SETTINGS_UUID:
             # Parses a 5 byte segment from the device and updates the state of the zone
@@ -66,8 +94,8 @@ class Valve:
             #     3-4 - 0x00, # duplicate of byte 1
             # ]
 
-            self._is_watering = struct.unpack_from(">?", raw_bytes, offset)[0]
-            self._manual_minutes = struct.unpack_from(">H", raw_bytes, offset + 1)[0]
+            self._is_watering = raw_bytes[offset] != 0
+            self._manual_minutes = _USHORT_STRUCT.unpack_from(raw_bytes, offset + 1)[0]
 
         elif uuid == VALVE_MANUAL_STATES_UUID:
             # byte segment for manual watering time left
@@ -76,11 +104,11 @@ class Valve:
             #     1-4 - 0x00, # timestamp - unsigned int
             # ]
 
-            parsed_time = self._end_time = struct.unpack_from(
-                ">I", raw_bytes, offset + 1
-            )[0]
+            parsed_time = _UINT_STRUCT.unpack_from(raw_bytes, offset + 1)[0]
 
-            self._end_time = parsed_time - time_shift() if parsed_time != 0 else 0
+            self._end_time = (
+                parsed_time - _cached_time_shift() if parsed_time != 0 else 0
+            )
 
     @property
     def id(self) -> int:
@@ -95,6 +123,7 @@ class Valve:
     def is_watering(self, value: bool) -> None:
         """Sets the watering state of the zone"""
         self._is_watering = value
+        self._device._invalidate_raw()  # pylint: disable=protected-access
 
     @property
     def manual_watering_minutes(self) -> int:
@@ -105,6 +134,7 @@ class Valve:
     def manual_watering_minutes(self, value: int) -> None:
         """Set the number of seconds the zone should manually watering for"""
         self._manual_minutes = value
+        self._device._invalidate_raw()  # pylint: disable=protected-access
 
     @property
     def watering_end_time(self) -> int:
@@ -114,8 +144,7 @@ class Valve:
     def _manual_setting_bytes(self) -> bytes:
         """Returns the 5 byte payload to be written to the device"""
 
-        return struct.pack(
-            ">?HH",
+        return _SETTINGS_STRUCT.pack(
             self._is_watering,
             self._manual_minutes,
             self._manual_minutes,
@@ -124,10 +153,9 @@ class Valve:
     def __str__(self) -> str:
         return (
             f"      Valve(id={self._id}|"
-            + f"is_watering={self._is_watering}|"
-            + f"manual_minutes={self._manual_minutes}|"
-            + f"seconds_left={self._end_time}"
-            + ")"
+            f"is_watering={self._is_watering}|"
+            f"manual_minutes={self._manual_minutes}|"
+            f"seconds_left={self._end_time})"
         )
 
 
@@ -138,10 +166,18 @@ class Device:
     _ble_device: BLEDevice
     _brand: str
     _connection: BleakClient
-    _connection_lock = asyncio.Lock()
+    _connection_lock: asyncio.Lock
+    _handlers: Dict[str, Callable[[bytes], None]]
     _is_connected: bool
+    _last_raw: Dict[str, bytes]
     _model: str
+    _on_off_handle: int | None
+    _on_off_response: bool
+    _push_buf: bytearray
+    _rssi: int
     _sensor: bool
+    _timestamp_buf: bytearray
+    _updated_at_handle: int | None
     _valves: List[Valve]
     _valve_count: int
 
@@ -149,8 +185,19 @@ class Device:
 
         self._battery = 0
         self._ble_device = ble_device
+        self._connection_lock = asyncio.Lock()
         self._is_connected = False
+        self._last_raw = {}
         self._mac = ble_device.address
+        self._rssi = ble_device.rssi
+
+        # Writes are serialized by the global lock, so the buffers are reused
+        self._push_buf = bytearray(_ALL_SETTINGS.size)
+        self._timestamp_buf = bytearray(_UINT_STRUCT.size)
+
+        self._on_off_handle = None
+        self._on_off_response = True
+        self._updated_at_handle = None
         self._valves = []
 
         # The 1 and 2 valve devices still use 4 valve bytes
@@ -159,6 +206,13 @@ class Device:
         for i in range(4):
             self._valves.append(Valve(i, self))
 
+        # Characteristics read on every fetch and the methods that decode them
+        self._handlers = {
+            BATTERY_UUID: self._apply_battery,
+            VALVE_MANUAL_SETTINGS_UUID: self._apply_settings,
+            VALVE_MANUAL_STATES_UUID: self._apply_states,
+        }
+
     async def _read_model(self):
         """Initializes the device"""
 
@@ -178,81 +232,114 @@ class Device:
     async def connect(self, retry_attempts=4) -> None:
         """Connects to the device"""
 
-        async with GLOBAL_BLUETOOTH_LOCK:
+        async with global_bluetooth_lock():
+            await self._connect_locked(retry_attempts)
 
-            if self._is_connected or self._connection_lock.locked():
-                return
+    async def _connect_locked(self, retry_attempts: int) -> None:
+        """Connects to the device, the caller must hold the global bluetooth lock"""
 
-            async with self._connection_lock:
+        if self._is_connected or self._connection_lock.locked():
+            return
 
-                try:
-                    _LOGGER.debug("Connecting to %s", self._mac)
+        async with self._connection_lock:
+
+            try:
+                _LOGGER.debug("Connecting to %s", self._mac)
+
+                self._connection = await establish_connection(
+                    client_class=BleakClient,
+                    device=self._ble_device,
+                    name=self._mac,
+                    disconnected_callback=self.disconnected_callback,
+                    max_attempts=retry_attempts,
+                )
 
-                    self._connection = await establish_connection(
-                        client_class=BleakClient,
-                        device=self._ble_device,
-                        name=self._mac,
-                        disconnected_callback=self.disconnected_callback,
-                        max_attempts=retry_attempts,
-                    )
+                self._is_connected = True
 
-                    self._is_connected = True
+                # Bluez handles certain types of advertisements poorly
+                # To work around the missing data we grab it here
+                # Callers simply need to connect and it'll be populated
+                await self._read_model()
 
-                    # Bluez handles certain types of advertisements poorly
-                    # To work around the missing data we grab it here
-                    # Callers simply need to connect and it'll be populated
-                    await self._read_model()
+                # Resolve the write handles once rather than on every push
+                services = self._connection.services
+                on_off = services.get_characteristic(VALVE_MANUAL_SETTINGS_UUID)
+                self._on_off_handle = getattr(on_off, "handle", None)
+                self._on_off_response = "write-without-response" not in getattr(
+                    on_off, "properties", ()
+                )
+                self._updated_at_handle = getattr(
+                    services.get_characteristic(UPDATED_AT_UUID), "handle", None
+                )
 
-                    _LOGGER.debug("Successfully connected to %s", self._mac)
+                _LOGGER.debug("Successfully connected to %s", self._mac)
 
-                except BleakError:
-                    _LOGGER.error("Failed to connect to %s", self._mac)
-                    self._is_connected = False
+            except BleakError:
+                _LOGGER.error("Failed to connect to %s", self._mac)
+                self._is_connected = False
 
     async def disconnect(self) -> None:
         """Disconnects the device"""
 
-        async with GLOBAL_BLUETOOTH_LOCK:
+        async with global_bluetooth_lock():
             await self._connection.disconnect()
 
     async def fetch_state(self) -> None:
         """Updates the state of the device with the given bytes"""
 
-        if not self._is_connected:
-            await self.connect(retry_attempts=1)
-
-        async with GLOBAL_BLUETOOTH_LOCK:
+        async with global_bluetooth_lock():
 
-            uuids = [
-                BATTERY_UUID,
-                VALVE_MANUAL_SETTINGS_UUID,
-                VALVE_MANUAL_STATES_UUID,
-            ]
+            if not self._is_connected:
+                await self._connect_locked(retry_attempts=1)
 
             try:
-                bytes_array: List[bytes] = await asyncio.gather(
-                    *[self._read(uuid) for uuid in uuids],
-                    return_exceptions=True,
-                )
-
-                for i, some_bytes in enumerate(bytes_array):
+                # GATT reads are serialized over the link anyway, so read them
+                # one at a time and bail out on the first failure
+                for uuid, handler in self._handlers.items():
+                    data = await self._read(uuid)
 
-                    uuid = uuids[i]
+                    # Idle timers mostly return the same bytes between polls
+                    if self._last_raw.get(uuid) == data:
+                        continue
 
-                    # This is a little awkward, but it's the only single
-                    # attribute we read regularly.
-                    if uuid == BATTERY_UUID:
-                        self._battery = parse_battery_value(some_bytes)
-
-                    for valve in self._valves:
-                        some_bytes = uuids.index(uuid)
-                        valve.update_state(bytes_array[some_bytes], uuids[i])
+                    # Only remember the bytes once they've been applied
+                    handler(data)
+                    self._last_raw[uuid] = data
 
             except BleakError as error:
                 # Only throw this error if the device is still connected
                 if self._is_connected:
                     raise error
 
+    def _invalidate_raw(self) -> None:
+        """Forgets the last fetched bytes so the next fetch decodes them again"""
+        self._last_raw.clear()
+
+    def _apply_battery(self, data: bytes) -> None:
+        """Updates the battery level from the battery characteristic"""
+        self._battery = parse_battery_value(data)
+
+    def _apply_settings(self, data: bytes) -> None:
+        """Updates every valve from the manual settings characteristic"""
+
+        vals = _ALL_SETTINGS.unpack(data)
+
+        # Each valve is (is_watering, minutes, minutes), the duplicate is ignored
+        for valve, is_watering, minutes in zip(self._valves, vals[0::3], vals[1::3]):
+            # pylint: disable=protected-access
+            valve._is_watering = is_watering
+            valve._manual_minutes = minutes
+
+    def _apply_states(self, data: bytes) -> None:
+        """Updates every valve from the manual states characteristic"""
+
+        vals = _ALL_STATES.unpack(data)
+        shift = _cached_time_shift()
+
+        for valve, parsed_time in zip(self._valves, vals[1::2]):
+            # pylint: disable=protected-access
+            valve._end_time = parsed_time - shift if parsed_time != 0 else 0
+
     async def _read(self, uuid: str) -> bytes:
         """Reads the given characteristic from the device"""
         return await self._connection.read_gatt_char(uuid)
@@ -260,33 +347,50 @@ class Device:
     async def push_state(self) -> None:
         """Pushes the new state of the device to the device"""
 
-        if not self._is_connected:
-            await self.connect(retry_attempts=1)
-
-        async with GLOBAL_BLUETOOTH_LOCK:
-
-            on_off = self._connection.services.get_characteristic(
-                VALVE_MANUAL_SETTINGS_UUID
-            )
+        async with global_bluetooth_lock():
+
+            # The device state is about to change, so don't trust the last
+            # fetched bytes to describe it anymore, even if this push fails
+            self._invalidate_raw()
+
+            if not self._is_connected:
+                await self._connect_locked(retry_attempts=1)
+
+            # Don't let callers believe a push landed when nothing was written
+            if not self._is_connected:
+                raise BleakError(f"Failed to connect to {self._mac}")
+
+            if self._on_off_handle is not None:
+                # pylint: disable=protected-access
+                v0, v1, v2, v3 = self._valves
+                _ALL_SETTINGS.pack_into(
+                    self._push_buf,
+                    0,
+                    v0._is_watering,
+                    v0._manual_minutes,
+                    v0._manual_minutes,
+                    v1._is_watering,
+                    v1._manual_minutes,
+                    v1._manual_minutes,
+                    v2._is_watering,
+                    v2._manual_minutes,
+                    v2._manual_minutes,
+                    v3._is_watering,
+                    v3._manual_minutes,
+                    v3._manual_minutes,
+                )
 
-            if on_off is not None:
+                # Skip the settings write response when the device allows it,
+                # the timestamp write below still waits for one
                 await self._connection.write_gatt_char(
-                    on_off.handle,
-                    (
-                        # pylint: disable=protected-access
-                        self._valves[0]._manual_setting_bytes()
-                        + self._valves[1]._manual_setting_bytes()
-                        + self._valves[2]._manual_setting_bytes()
-                        + self._valves[3]._manual_setting_bytes()
-                    ),
-                    True,
+                    self._on_off_handle, self._push_buf, self._on_off_response
                 )
 
-            updated_at = self._connection.services.get_characteristic(UPDATED_AT_UUID)
+            if self._updated_at_handle is not None:
+                _UINT_STRUCT.pack_into(self._timestamp_buf, 0, get_timestamp())
 
-            if updated_at is not None:
                 await self._connection.write_gatt_char(
-                    updated_at.handle, struct.pack(">I", get_timestamp()), True
+                    self._updated_at_handle, self._timestamp_buf, True
                 )
 
     @property
@@ -322,7 +426,7 @@ class Device:
     @property
     def rssi(self) -> int:
         """Returns the RSSI of the device"""
-        return self._ble_device.rssi
+        return self._rssi
 
     @property
     def valve_count(self) -> int:
@@ -360,21 +464,16 @@ class Device:
     def update_ble_device(self, ble_device: BLEDevice) -> None:
         """Updates the cached BLEDevice for the device"""
         self._ble_device = ble_device
+        self._rssi = ble_device.rssi
 
     def __str__(self) -> str:
-        string = (
-            f"{self.__class__.__name__}(\n    battery={self._battery}\n    valves=(\n"
+        valves_str = "\n".join(str(valve) for valve in self._valves)
+        return (
+            f"{type(self).__name__}(\n    battery={self._battery}\n    valves=(\n"
+            f"{valves_str}\n    )\n)"
         )
-        for valve in self._valves:
-            string += f"{valve}\n"
-        return f"{string}    )\n)"
 
     def __getitem__(self, key: str) -> Valve | None:
-        if key == "zone1":
-            return self.zone1
-        elif key == "zone2":
-            return self.zone2
-        elif key == "zone3":
-            return self.zone3
-        elif key == "zone4":
-            return self.zone4
+        if key in _ZONE_KEYS:
+            return getattr(self, key)
+        return None
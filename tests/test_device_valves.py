@@ -7,6 +7,7 @@ from zoneinfo import ZoneInfo
 import freezegun
 import pytest
 from bleak.backends.device import BLEDevice
+from bleak.exc import BleakError
 from bleak_retry_connector import BleakClient  # type: ignore - this is a valid import
 from mockito import ANY, expect, mock, verify, when
 
@@ -14,10 +15,12 @@ import melnor_bluetooth.device as device_module
 from melnor_bluetooth.constants import (
     BATTERY_UUID,
     MANUFACTURER_UUID,
+    UPDATED_AT_UUID,
     VALVE_MANUAL_SETTINGS_UUID,
     VALVE_MANUAL_STATES_UUID,
 )
 from melnor_bluetooth.device import Device, Valve
+from melnor_bluetooth.parser.date import get_timestamp, time_shift
 from tests.constants import TEST_UUID
 
 zone_manual_setting_bytes = struct.pack(
@@ -78,6 +81,13 @@ def client_mock() -> Type:
 
     when(c_mock).connect(timeout=60).thenReturn(connect)
 
+    services = mock()
+    when(services).get_characteristic(VALVE_MANUAL_SETTINGS_UUID).thenReturn(
+        mock({"handle": 1, "properties": ["read", "write"]})
+    )
+    when(services).get_characteristic(UPDATED_AT_UUID).thenReturn(mock({"handle": 2}))
+    c_mock.services = services
+
     return c_mock
 
 
@@ -90,6 +100,19 @@ class TestValveZone:
         assert device.zone1.is_watering == True
         assert device.zone1.manual_watering_minutes == 5
 
+    def test_zone_update_state_end_time(self, client_mock, ble_device_mock):
+        device = Device(ble_device=ble_device_mock)
+
+        states = struct.pack(">bIbIbIbI", 1, 0, 1, 4294967295, 1, 0, 1, 0)
+
+        device.zone1.update_state(states, VALVE_MANUAL_STATES_UUID)
+        device._valves[1].update_state(states, VALVE_MANUAL_STATES_UUID)  # type:ignore
+
+        assert device.zone1.watering_end_time == 0
+        assert device._valves[1].watering_end_time == (  # type:ignore
+            4294967295 - time_shift()
+        )
+
     def test_zone_properties(self, client_mock, ble_device_mock):
         device = Device(ble_device=ble_device_mock)
 
@@ -115,6 +138,25 @@ class TestValveZone:
         assert zone._manual_setting_bytes() == b"\x01\x00\n\x00\n"  # type: ignore
 
 
+class TestTimeShiftCache:
+    def test_cached_time_shift(self, monkeypatch):
+        shifts = iter([1, 2])
+
+        monkeypatch.setattr(device_module, "_time_shift_cache", None)
+        monkeypatch.setattr(device_module, "time_shift", lambda: next(shifts))
+
+        with freezegun.freeze_time(datetime.datetime.now(tz=ZoneInfo("UTC"))) as now:
+            assert device_module._cached_time_shift() == 1
+
+            now.tick(datetime.timedelta(seconds=device_module._TIME_SHIFT_TTL))
+
+            assert device_module._cached_time_shift() == 1
+
+            now.tick(datetime.timedelta(seconds=1))
+
+            assert device_module._cached_time_shift() == 2
+
+
 class TestDevice:
     async def test_properties(self, client_mock, ble_device_mock):
 
@@ -128,6 +170,23 @@ class TestDevice:
         assert device.valve_count == 4
         assert device.rssi == ble_device_mock.rssi
 
+    def test_connection_lock_per_device(self, ble_device_mock):
+        one = Device(ble_device=ble_device_mock)
+        two = Device(ble_device=ble_device_mock)
+
+        assert one._connection_lock is not two._connection_lock  # type:ignore
+
+    def test_update_ble_device(self, ble_device_mock):
+        device = Device(ble_device=ble_device_mock)
+
+        updated = mock(spec=BLEDevice)
+        updated.address = TEST_UUID
+        updated.rssi = -40
+
+        device.update_ble_device(updated)
+
+        assert device.rssi == -40
+
     async def test_get_item(self, client_mock, ble_device_mock):
         device = Device(ble_device=ble_device_mock)
 
@@ -137,6 +196,8 @@ class TestDevice:
         assert device["zone2"] is device.zone2
         assert device["zone3"] is device.zone3
         assert device["zone4"] is device.zone4
+        assert device["zone5"] is None
+        assert device["valve_count"] is None
 
     async def test_1_valve_device(self, client_mock, ble_device_mock):
 
@@ -368,6 +429,293 @@ class TestDevice:
         assert device.zone4.manual_watering_minutes == 0
         assert device.zone4.watering_end_time == 0
 
+    async def test_fetch_all_valves(self, client_mock, ble_device_mock):
+        device = Device(ble_device=ble_device_mock)
+
+        read_battery = asyncio.Future()
+        read_battery.set_result(b"\x02\x85")
+
+        read_manual_settings = asyncio.Future()
+        read_manual_settings.set_result(zone_manual_setting_bytes)
+
+        read_manual_state = asyncio.Future()
+        read_manual_state.set_result(struct.pack(">bIbIbIbI", 1, 0, 1, 0, 1, 0, 1, 0))
+
+        when(client_mock).read_gatt_char(BATTERY_UUID).thenReturn(read_battery)
+
+        when(client_mock).read_gatt_char(VALVE_MANUAL_SETTINGS_UUID).thenReturn(
+            read_manual_settings
+        )
+
+        when(client_mock).read_gatt_char(VALVE_MANUAL_STATES_UUID).thenReturn(
+            read_manual_state
+        )
+
+        # fetch_state connects on demand
+        await device.fetch_state()
+
+        assert device.is_connected is True
+
+        for valve, minutes in zip(device._valves, [5, 10, 15, 20]):  # type:ignore
+            assert valve.is_watering is True
+            assert valve.manual_watering_minutes == minutes
+            assert valve.watering_end_time == 0
+
+    async def test_fetch_skips_unchanged(
+        self, client_mock, ble_device_mock, monkeypatch
+    ):
+        applied = []
+        apply_settings = Device._apply_settings
+
+        def _apply_settings(self, data):
+            applied.append(data)
+            apply_settings(self, data)
+
+        monkeypatch.setattr(Device, "_apply_settings", _apply_settings)
+
+        device = Device(ble_device=ble_device_mock)
+
+        read_battery = asyncio.Future()
+        read_battery.set_result(b"\x02\x85")
+
+        read_manual_settings = asyncio.Future()
+        read_manual_settings.set_result(zone_manual_setting_bytes)
+
+        read_manual_state = asyncio.Future()
+        read_manual_state.set_result(struct.pack(">bIbIbIbI", 1, 0, 1, 0, 1, 0, 1, 0))
+
+        when(client_mock).read_gatt_char(BATTERY_UUID).thenReturn(read_battery)
+
+        when(client_mock).read_gatt_char(VALVE_MANUAL_SETTINGS_UUID).thenReturn(
+            read_manual_settings
+        )
+
+        when(client_mock).read_gatt_char(VALVE_MANUAL_STATES_UUID).thenReturn(
+            read_manual_state
+        )
+
+        await device.fetch_state()
+        await device.fetch_state()
+
+        # Same bytes as last time, so they were only decoded once
+        assert len(applied) == 1
+
+        device.zone1.manual_watering_minutes = 30
+
+        # A local edit invalidates the cache, the device state is restored
+        await device.fetch_state()
+
+        assert len(applied) == 2
+        assert device.zone1.manual_watering_minutes == 5
+
+    async def test_fetch_connects_under_one_lock(
+        self, client_mock, ble_device_mock, monkeypatch
+    ):
+        locks_taken = []
+        global_bluetooth_lock = device_module.global_bluetooth_lock
+
+        def _global_bluetooth_lock():
+            locks_taken.append(True)
+            return global_bluetooth_lock()
+
+        async def _connect(self, retry_attempts=4):
+            pytest.fail("fetch_state should connect without re-taking the lock")
+
+        monkeypatch.setattr(
+            device_module, "global_bluetooth_lock", _global_bluetooth_lock
+        )
+        monkeypatch.setattr(Device, "connect", _connect)
+
+        device = Device(ble_device=ble_device_mock)
+
+        read_battery = asyncio.Future()
+        read_battery.set_result(b"\x02\x85")
+
+        read_manual_settings = asyncio.Future()
+        read_manual_settings.set_result(zone_manual_setting_bytes)
+
+        read_manual_state = asyncio.Future()
+        read_manual_state.set_result(struct.pack(">bIbIbIbI", 1, 0, 1, 0, 1, 0, 1, 0))
+
+        when(client_mock).read_gatt_char(BATTERY_UUID).thenReturn(read_battery)
+
+        when(client_mock).read_gatt_char(VALVE_MANUAL_SETTINGS_UUID).thenReturn(
+            read_manual_settings
+        )
+
+        when(client_mock).read_gatt_char(VALVE_MANUAL_STATES_UUID).thenReturn(
+            read_manual_state
+        )
+
+        await device.fetch_state()
+
+        assert device.is_connected is True
+        assert len(locks_taken) == 1
+
+    async def test_fetch_retries_bytes_that_failed(self, client_mock, ble_device_mock):
+        device = Device(ble_device=ble_device_mock)
+
+        read_battery = asyncio.Future()
+        read_battery.set_result(b"\x02\x85")
+
+        read_manual_settings = asyncio.Future()
+        read_manual_settings.set_result(zone_manual_setting_bytes[:7])
+
+        when(client_mock).read_gatt_char(BATTERY_UUID).thenReturn(read_battery)
+
+        when(client_mock).read_gatt_char(VALVE_MANUAL_SETTINGS_UUID).thenReturn(
+            read_manual_settings
+        )
+
+        with pytest.raises(struct.error):
+            await device.fetch_state()
+
+        # The truncated payload was never applied, so it isn't skipped either
+        with pytest.raises(struct.error):
+            await device.fetch_state()
+
+    @freezegun.freeze_time(datetime.datetime.now(tz=ZoneInfo("UTC")))
+    async def test_push(self, client_mock, ble_device_mock):
+        device = Device(ble_device=ble_device_mock)
+
+        written = asyncio.Future()
+        written.set_result(None)
+        when(client_mock).write_gatt_char(ANY, ANY, True).thenReturn(written)
+
+        await device.connect()
+
+        device.zone1.is_watering = True
+        device.zone1.manual_watering_minutes = 10
+
+        await device.push_state()
+
+        verify(client_mock).write_gatt_char(
+            1,
+            b"\x01\x00\n\x00\n\x00\x00\x14\x00\x14\x00\x00\x14\x00\x14\x00\x00\x14\x00\x14",  # noqa: E501
+            True,
+        )
+        verify(client_mock).write_gatt_char(2, struct.pack(">I", get_timestamp()), True)
+
+    async def test_push_after_failed_connect(self, client_mock, ble_device_mock):
+        device = Device(ble_device=ble_device_mock)
+
+        when(device_module).establish_connection(
+            client_class=ANY,
+            device=ANY,
+            name=ANY,
+            disconnected_callback=ANY,
+            max_attempts=ANY,
+        ).thenRaise(BleakError("boom"))
+
+        with pytest.raises(BleakError):
+            await device.push_state()
+
+        verify(client_mock, times=0).write_gatt_char(ANY, ANY, ANY)
+
+    async def test_fetch_after_failed_push(self, client_mock, ble_device_mock):
+        device = Device(ble_device=ble_device_mock)
+
+        read_battery = asyncio.Future()
+        read_battery.set_result(b"\x02\x85")
+
+        read_manual_settings = asyncio.Future()
+        read_manual_settings.set_result(zone_manual_setting_bytes)
+
+        read_manual_state = asyncio.Future()
+        read_manual_state.set_result(struct.pack(">bIbIbIbI", 1, 0, 1, 0, 1, 0, 1, 0))
+
+        when(client_mock).read_gatt_char(BATTERY_UUID).thenReturn(read_battery)
+
+        when(client_mock).read_gatt_char(VALVE_MANUAL_SETTINGS_UUID).thenReturn(
+            read_manual_settings
+        )
+
+        when(client_mock).read_gatt_char(VALVE_MANUAL_STATES_UUID).thenReturn(
+            read_manual_state
+        )
+
+        await device.fetch_state()
+
+        device.disconnected_callback(client_mock)
+
+        device.zone1.manual_watering_minutes = 30
+
+        connect = asyncio.Future()
+        connect.set_result(client_mock)
+
+        when(device_module).establish_connection(
+            client_class=ANY,
+            device=ANY,
+            name=ANY,
+            disconnected_callback=ANY,
+            max_attempts=ANY,
+        ).thenRaise(BleakError("boom")).thenReturn(connect)
+
+        with pytest.raises(BleakError):
+            await device.push_state()
+
+        # The push never landed, so the device's state wins on the next fetch
+        await device.fetch_state()
+
+        assert device.zone1.manual_watering_minutes == 5
+
+    async def test_push_refreshes_next_fetch(self, client_mock, ble_device_mock):
+        device = Device(ble_device=ble_device_mock)
+
+        read_battery = asyncio.Future()
+        read_battery.set_result(b"\x02\x85")
+
+        read_manual_settings = asyncio.Future()
+        read_manual_settings.set_result(zone_manual_setting_bytes)
+
+        read_manual_state = asyncio.Future()
+        read_manual_state.set_result(struct.pack(">bIbIbIbI", 1, 0, 1, 0, 1, 0, 1, 0))
+
+        when(client_mock).read_gatt_char(BATTERY_UUID).thenReturn(read_battery)
+
+        when(client_mock).read_gatt_char(VALVE_MANUAL_SETTINGS_UUID).thenReturn(
+            read_manual_settings
+        )
+
+        when(client_mock).read_gatt_char(VALVE_MANUAL_STATES_UUID).thenReturn(
+            read_manual_state
+        )
+
+        written = asyncio.Future()
+        written.set_result(None)
+        when(client_mock).write_gatt_char(ANY, ANY, True).thenReturn(written)
+
+        await device.fetch_state()
+
+        device.zone1.manual_watering_minutes = 30
+
+        await device.push_state()
+
+        # The device still reports the old settings, so they're applied again
+        await device.fetch_state()
+
+        assert device.zone1.manual_watering_minutes == 5
+
+    async def test_push_without_response(self, client_mock, ble_device_mock):
+        device = Device(ble_device=ble_device_mock)
+
+        when(client_mock.services).get_characteristic(
+            VALVE_MANUAL_SETTINGS_UUID
+        ).thenReturn(
+            mock({"handle": 1, "properties": ["write", "write-without-response"]})
+        )
+
+        written = asyncio.Future()
+        written.set_result(None)
+        when(client_mock).write_gatt_char(ANY, ANY, ANY).thenReturn(written)
+
+        await device.connect()
+
+        await device.push_state()
+
+        verify(client_mock).write_gatt_char(1, ANY, False)
+        verify(client_mock).write_gatt_char(2, ANY, True)
+
     def test_str(self, snapshot, ble_device_mock):
         device = Device(ble_device=ble_device_mock)
 